@@ -1,28 +1,97 @@
-from flask import Flask, request, send_file, abort, jsonify, after_this_request, current_app
-import os, tempfile, shutil, subprocess, zipfile, logging, re
+from flask import Flask, Response, request, send_file, abort, jsonify, current_app, g, has_request_context
+import os, io, tempfile, shutil, subprocess, zipfile, logging, re, threading, hashlib, socket, itertools, contextlib, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 os.environ["OMP_THREAD_LIMIT"] = "1"
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import NotFound
 from flask_cors import CORS
+from flask.json.provider import DefaultJSONProvider
+try:
+    import orjson
+except ImportError:
+    orjson = None
 # ======================================================
 # BASIC CONFIG
 # ======================================================
 logging.getLogger("werkzeug").setLevel(logging.ERROR)
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+class ORJSONProvider(DefaultJSONProvider):
+    # /extract-text can return megabytes of (mostly non-ASCII) text; orjson
+    # encodes it in C straight to UTF-8 bytes instead of \u-escaping it
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=orjson.OPT_APPEND_NEWLINE),
+            mimetype=self.mimetype,
+        )
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 os.environ.setdefault("UNO_PATH", "/usr/lib/libreoffice/program")
 os.environ["PATH"] += ":/usr/lib/libreoffice/program:/usr/bin:/usr/local/bin"
-POPPLER_PATH = "/usr/bin"
+# resolved once at import instead of stat()ing all of $PATH per request
+GS_PATH = shutil.which("gs")
+LIBREOFFICE_PATH = shutil.which("libreoffice")
+# set by gunicorn.conf.py to the ports of the unoservers it started
+UNOSERVER_PORTS = [p for p in os.environ.get("UNOSERVER_PORTS", "").split(",") if p]
 app.config["MAX_CONTENT_LENGTH"] = 200 * 1024 * 1024
 
 PER_TOOL_LIMIT_BYTES = {
     "default": 25 * 1024 * 1024,
     "compress-pdf": 50 * 1024 * 1024,
 }
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # read/write size when copying uploads to disk
 MAX_OCR_PAGES = 30
 OCR_DPI = 150
+OCR_SAMPLE_DPI = 72
+OCR_RETRY_DPI = 300
+OCR_RETRY_CONF = 60  # mean tesseract confidence below which a page is re-read at OCR_RETRY_DPI
+NATIVE_TEXT_MIN_CHARS = 20  # avg chars/page above which a PDF counts as born-digital
+OCR_PAGE_TEXT_MIN_CHARS = 40  # pages with less native text than this get OCR'd
+OCR_LANG = "hin+mar+guj+eng"
+def available_cpus():
+    # os.cpu_count() is the host's count inside a container; honour the
+    # affinity mask and the cgroup CPU quota (v2 cpu.max, else v1 cfs)
+    n = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fh:
+            quota, period = fh.read().split()
+    except OSError:
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as q, open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as p:
+                quota, period = q.read().strip(), p.read().strip()
+        except OSError:
+            return n
+    try:
+        if quota not in ("max", "-1"):
+            n = min(n, max(1, int(quota) // int(period)))
+    except ValueError:
+        pass
+    return n
+# each pool process holds every OCR_LANG model (~100 MB+), and there is a
+# pool per gunicorn worker: keep the default small for 512 MB hosts
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", min(available_cpus(), 2)))
+OCR_BATCH_PAGES = 50  # max pages per tesseract run when falling back to pytesseract
 PDF_TO_JPG_DPI = 200
-IMAGE_THREAD_COUNT = 1
 SUBPROCESS_TIMEOUT = 120
+CACHE_DIR = os.environ.get("CACHE_DIR", "/tmp/pdfcache")
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 500 * 1024 * 1024))
+# per-request scratch files go to tmpfs when the host gives /dev/shm room
+# for them (Docker's default 64 MB does not); an explicit TMPDIR wins
+SHM_MIN_FREE_BYTES = 1024 * 1024 * 1024
+if "TMPDIR" not in os.environ and os.path.isdir("/dev/shm"):
+    try:
+        if shutil.disk_usage("/dev/shm").free > SHM_MIN_FREE_BYTES:
+            tempfile.tempdir = "/dev/shm"
+    except OSError:
+        pass
+# /extract-text uses PyMuPDF; set to 1 to go back to pdfplumber's layout-aware (much slower) extraction
+EXTRACT_WITH_PDFPLUMBER = os.environ.get("EXTRACT_WITH_PDFPLUMBER") == "1"
 # ======================================================
 # LAZY IMPORTS
 # ======================================================
@@ -32,24 +101,40 @@ def lazy_pdf2docx_converter():
 def lazy_pil_Image():
     from PIL import Image
     return Image
-def lazy_pdf2image_convert():
-    from pdf2image import convert_from_path
-    return convert_from_path
+def lazy_fitz():
+    import pymupdf as fitz
+    return fitz
 def lazy_pytesseract():
     import pytesseract
     return pytesseract
+def lazy_tesserocr():
+    import tesserocr
+    return tesserocr
+def lazy_unoclient():
+    from unoserver.client import UnoClient
+    return UnoClient
+def lazy_img2pdf():
+    import img2pdf
+    return img2pdf
 def lazy_pikepdf():
     import pikepdf
     return pikepdf
-def lazy_pypdf():
-    from PyPDF2 import PdfReader, PdfWriter, PdfMerger
-    return PdfReader, PdfWriter, PdfMerger
 def lazy_pdfplumber():
     import pdfplumber
     return pdfplumber
 def lazy_docx_Document():
     from docx import Document
     return Document
+def warm_imports():
+    # called from gunicorn's post_worker_init so a fresh worker's first
+    # request doesn't pay for these imports; tesseract itself runs in the
+    # OCR pool processes and is loaded there
+    for load in (lazy_pdf2docx_converter, lazy_pil_Image, lazy_fitz, lazy_pikepdf,
+                 lazy_pdfplumber, lazy_docx_Document):
+        try:
+            load()
+        except ImportError as e:
+            logging.warning("warm-up import failed: %s", e)
 def with_filename(response, filename):
     response.headers["X-Filename"] = filename
     return response
@@ -72,6 +157,13 @@ def cleanup(path):
             os.remove(path)
     except Exception:
         pass
+def cleanup_after_request(*paths):
+    # one teardown hook per app instead of a cleanup closure per request
+    g.setdefault("cleanup_paths", []).extend(paths)
+@app.teardown_request
+def cleanup_request_files(exc):
+    for p in g.pop("cleanup_paths", ()):
+        cleanup(p)
 # ======================================================
 # SAFE STREAMED UPLOAD (SIZE ENFORCED)
 # ======================================================
@@ -80,15 +172,59 @@ def get_limit_for_tool(tool):
 def save_upload(file_obj, ext=None, max_bytes=None):
     filename = secure_filename(file_obj.filename or "upload")
     extension = ext if ext else os.path.splitext(filename)[1]
-    path = tmp_file(extension)
+    fd = upload_fd(file_obj.stream)
+    if fd is not None:
+        return copy_fd_to_tmp(fd, extension, max_bytes)
+    return copy_stream_to_tmp(file_obj.stream, extension, max_bytes)
+def save_request_body(ext=None, max_bytes=None):
+    # raw (non-multipart) uploads: the request body *is* the file
+    return copy_stream_to_tmp(request.stream, ext or "", max_bytes)
+def copy_stream_to_tmp(stream, ext, max_bytes=None):
+    path = tmp_file(ext)
     total = 0
+    h = hashlib.sha256()
     with open(path, "wb") as f:
-        for chunk in iter(lambda: file_obj.stream.read(65536), b""):
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b""):
             total += len(chunk)
             if max_bytes and total > max_bytes:
                 cleanup(path)
                 raise ValueError("File too large")
+            h.update(chunk)
             f.write(chunk)
+    # hashed on the way in so cache_key doesn't read the file again
+    g.setdefault("upload_sha256", {})[path] = h.hexdigest()
+    return path
+def upload_fd(stream):
+    # Werkzeug spools multipart files over 500 KB to an unnamed temp file;
+    # smaller ones stay in memory (fileno() would force them to disk)
+    if isinstance(stream, tempfile.SpooledTemporaryFile) and not stream._rolled:
+        return None
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+def copy_fd_to_tmp(fd, ext, max_bytes=None):
+    # the spooled size is known, so an oversized upload is refused before
+    # anything is copied; the copy goes through one reused buffer so it can
+    # be hashed on the way (a kernel-side sendfile would mean reading the
+    # file again for cache_key)
+    size = os.fstat(fd).st_size
+    if max_bytes and size > max_bytes:
+        raise ValueError("File too large")
+    path = tmp_file(ext)
+    h = hashlib.sha256()
+    buf = bytearray(UPLOAD_CHUNK_BYTES)
+    view = memoryview(buf)
+    with open(path, "wb") as f:
+        offset = 0
+        while offset < size:
+            n = os.preadv(fd, [view], offset)
+            if not n:
+                break
+            h.update(view[:n])
+            f.write(view[:n])
+            offset += n
+    g.setdefault("upload_sha256", {})[path] = h.hexdigest()
     return path
 def check_request_size_from_files(files, tool):
     limit = get_limit_for_tool(tool)
@@ -96,86 +232,385 @@ def check_request_size_from_files(files, tool):
         return False, "Upload too large"
     return True, ""
 # ======================================================
+# RESULT CACHE (content addressed, LRU by mtime)
+# ======================================================
+# Ghostscript, pdf2docx and tesseract are deterministic, so a result can
+# be reused whenever the same bytes come back with the same options.
+def file_sha256(path):
+    if has_request_context():
+        known = g.get("upload_sha256", {}).get(path)
+        if known:
+            return known
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+def cache_key(tool, path, **params):
+    opts = "&".join(f"{k}={params[k]}" for k in sorted(params))
+    return hashlib.sha256(f"{tool}:{file_sha256(path)}:{opts}".encode()).hexdigest()
+def cache_get(key):
+    # returns an open file so a concurrent eviction can't pull it away
+    # between the lookup and send_file
+    if not CACHE_MAX_BYTES:
+        return None
+    path = os.path.join(CACHE_DIR, key)
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return f
+# Identical requests racing in one worker would all miss and all convert;
+# holding the key's lock around miss -> convert -> cache_put makes the
+# later ones wait and then hit. One lock per in-flight key, dropped when
+# its last holder leaves, so unrelated jobs never wait on each other.
+_cache_locks = {}
+_cache_locks_guard = threading.Lock()
+@contextlib.contextmanager
+def cache_lock(key):
+    if not CACHE_MAX_BYTES:
+        yield
+        return
+    with _cache_locks_guard:
+        entry = _cache_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _cache_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _cache_locks[key]
+def cache_put(key, src):
+    if not CACHE_MAX_BYTES:
+        return
+    dst = os.path.join(CACHE_DIR, key)
+    part = f"{dst}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        try:
+            os.link(src, part)  # no copy when the cache is on the same fs
+        except OSError:
+            shutil.copyfile(src, part)
+        os.replace(part, dst)
+    except OSError:
+        cleanup(part)
+        return
+    evict_cache()
+def cache_put_text(key, text):
+    path = tmp_file(".txt")
+    try:
+        with open(path, "w", encoding="utf-8") as o:
+            o.write(text)
+        cache_put(key, path)
+    finally:
+        cleanup(path)
+def evict_cache():
+    entries = []
+    total = 0
+    for e in os.scandir(CACHE_DIR):
+        try:
+            st = e.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, e.path))
+        total += st.st_size
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        cleanup(path)
+        total -= size
+# ======================================================
 # SUBPROCESS SAFETY
 # ======================================================
+# opened once and dup2'd onto each child's stdout
+DEVNULL_FD = os.open(os.devnull, os.O_WRONLY)
 def run_subprocess(cmd, timeout=SUBPROCESS_TIMEOUT):
+    # nothing reads gs/soffice stdout; stderr stays piped for the
+    # CalledProcessError. Python's own fds are non-inheritable (PEP 446),
+    # so close_fds=False only skips the child's fd sweep.
     subprocess.run(
         cmd,
         timeout=timeout,
-        stdout=subprocess.PIPE,
+        stdout=DEVNULL_FD,
         stderr=subprocess.PIPE,
+        close_fds=False,
         check=True
     )
 # ======================================================
+# STREAMED ZIP RESPONSES
+# ======================================================
+class ZipSink:
+    # write-only, unseekable: zipfile then emits data descriptors and never
+    # seeks back, so every finished entry can be sent right away
+    def __init__(self):
+        self.buf = bytearray()
+    def write(self, b):
+        self.buf += b
+        return len(b)
+    def flush(self):
+        pass
+    def drain(self):
+        data = bytes(self.buf)
+        self.buf.clear()
+        return data
+def stream_zip(entries):
+    # entries: iterable of (arcname, bytes) built in memory; PDFs/JPEGs are
+    # already compressed, so store them instead of deflating again
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as z:
+        for arcname, data in entries:
+            z.writestr(arcname, data)
+            yield sink.drain()
+    yield sink.drain()
+def send_zip_stream(entries, download_name, *paths):
+    resp = Response(stream_zip(entries), mimetype="application/zip")
+    resp.headers.set("Content-Disposition", "attachment", filename=download_name)
+    # the body is produced after the view returns: clean up once it is sent
+    resp.call_on_close(lambda: [cleanup(p) for p in paths])
+    return resp
+# ======================================================
 # TEXT FORMATTING (UNCHANGED LOGIC)
 # ======================================================
-BULLET_PATTERNS = [
-    r'^\s*[-•]\s+',
-    r'^\s*\d+\.\s+',
-]
-def is_bullet_line(s):
-    return any(re.match(p, s.strip()) for p in BULLET_PATTERNS)
-def detect_heading(lines):
-    heads = set()
-    for i, ln in enumerate(lines):
+# "- item", "• item" or "1. item", compiled once as a single alternation
+BULLET_RE = re.compile(r'^\s*(?:[-•]|\d+\.)\s+')
+# line tags are bit flags: an all-caps bullet is both a heading (when it
+# starts a block) and a bullet (when it continues a list)
+LINE_TEXT, LINE_BULLET, LINE_HEADING = 0, 1, 2
+def page_lines(pages):
+    # every page's lines in order, without joining the document into one string
+    for page in pages:
+        yield from page.splitlines()
+def classify_lines(raw):
+    # one pass: drop blank lines, tag the rest so nothing is re-stripped later
+    # raw is either the whole text or an iterable of lines (see page_lines)
+    tagged = []
+    for ln in (raw.splitlines() if isinstance(raw, str) else raw):
         t = ln.strip()
-        if t and 1 <= len(t.split()) <= 8 and t.isupper():
-            heads.add(i)
-    return heads
+        if not t:
+            continue
+        kind = LINE_TEXT
+        if BULLET_RE.match(t):
+            kind |= LINE_BULLET
+        if t.isupper() and len(t.split()) <= 8:
+            kind |= LINE_HEADING
+        tagged.append((ln.rstrip(), kind))
+    return tagged
 def merge_lines_to_paragraphs(raw):
-    lines = [l.rstrip() for l in raw.splitlines() if l.strip()]
-    heads = detect_heading(lines)
+    tagged = classify_lines(raw)
     out = []
-    i = 0
-    while i < len(lines):
-        if i in heads:
-            out.append(lines[i])
+    i, n = 0, len(tagged)
+    while i < n:
+        line, kind = tagged[i]
+        if kind & LINE_HEADING:
+            out.append(line)
             i += 1
             continue
-        if is_bullet_line(lines[i]):
-            b = []
-            while i < len(lines) and is_bullet_line(lines[i]):
-                b.append(lines[i])
-                i += 1
-            out.append("\n".join(b))
-            continue
-        p = [lines[i]]
-        i += 1
-        while i < len(lines) and i not in heads and not is_bullet_line(lines[i]):
-            p.append(lines[i])
-            i += 1
-        out.append(" ".join(p))
+        j = i + 1
+        if kind & LINE_BULLET:
+            while j < n and tagged[j][1] & LINE_BULLET:
+                j += 1
+            out.append("\n".join(l for l, _ in tagged[i:j]))
+        else:
+            while j < n and tagged[j][1] == LINE_TEXT:
+                j += 1
+            out.append(" ".join(l for l, _ in tagged[i:j]))
+        i = j
     return "\n\n".join(out)
 # ======================================================
 # OCR
 # ======================================================
-def ocr_pdf_to_text(pdf_path, max_pages=MAX_OCR_PAGES, dpi=OCR_DPI):
-    convert_from_path = lazy_pdf2image_convert()
-    pytesseract = lazy_pytesseract()
+def extract_native_text(pdf_path):
+    # a text-layer read is cheap (well under a second for hundreds of
+    # pages); it stays in-process, the OCR pool is for tesseract work
+    fitz = lazy_fitz()
+    with fitz.open(pdf_path) as doc:
+        return [page.get_text("text") for page in doc]
+def has_text_layer(pages):
+    return bool(pages) and sum(len(t.strip()) for t in pages) / len(pages) >= NATIVE_TEXT_MIN_CHARS
+def looks_scanned(pdf_path, probe_pages=2):
+    # no text on the first pages: treat as a scan without reading the rest
+    fitz = lazy_fitz()
+    with fitz.open(pdf_path) as doc:
+        n = min(probe_pages, doc.page_count)
+        return sum(len(doc[i].get_text("text").strip()) for i in range(n)) < NATIVE_TEXT_MIN_CHARS
+# One pool per gunicorn worker, created on first use and kept for its
+# lifetime. Each pool process loads the tesseract engine once (tesserocr)
+# instead of paying a tesseract fork + traineddata load on every page.
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+_tess_api = None
+def _init_ocr_worker():
+    global _tess_api
+    try:
+        tesserocr = lazy_tesserocr()
+    except ImportError:
+        return  # pytesseract fallback in _ocr_one_page
+    _tess_api = tesserocr.PyTessBaseAPI(
+        lang=OCR_LANG,
+        oem=tesserocr.OEM.LSTM_ONLY,
+        psm=tesserocr.PSM.AUTO,
+    )
+def get_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            # created lazily from a request thread: a forked child could
+            # inherit mutexes other threads hold inside MuPDF/qpdf and
+            # copies of open client sockets, so start from a clean forkserver
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=max(OCR_WORKERS, 1),
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=_init_ocr_worker,
+            )
+        return _ocr_pool
+def reset_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        pool, _ocr_pool = _ocr_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+def _render_gray_pixmap(pdf_path, index, dpi):
+    fitz = lazy_fitz()
+    # render straight to a grayscale pixmap; no PNG round-trip through disk
+    with fitz.open(pdf_path) as doc:
+        return doc[index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+def _render_gray(pdf_path, index, dpi):
     Image = lazy_pil_Image()
-    tmpd = tmp_dir()
+    pix = _render_gray_pixmap(pdf_path, index, dpi)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+def _set_tess_page(pdf_path, index, dpi):
+    # hand tesseract the raw 8-bit rows; SetImage(PIL) would re-encode the
+    # page as an in-memory BMP first. The DPI also spares tesseract its
+    # "invalid resolution" guess.
+    pix = _render_gray_pixmap(pdf_path, index, dpi)
+    _tess_api.SetImageBytes(pix.samples, pix.width, pix.height, 1, pix.stride)
+    _tess_api.SetSourceResolution(dpi)
+def _ocr_one_page(job):
+    if _tess_api is not None:
+        pdf_path, index, dpi = job
+        _set_tess_page(pdf_path, index, dpi)
+        text = _tess_api.GetUTF8Text()
+        # a weak (but non-empty) read gets one more pass with more pixels;
+        # tesserocr reports the confidence for free, pytesseract would
+        # need a second tesseract run just to find out
+        if text.strip() and dpi < OCR_RETRY_DPI and _tess_api.MeanTextConf() < OCR_RETRY_CONF:
+            _set_tess_page(pdf_path, index, OCR_RETRY_DPI)
+            text = _tess_api.GetUTF8Text()
+        return text
+    pytesseract = lazy_pytesseract()
+    return pytesseract.image_to_string(
+        _render_gray(*job),
+        lang=OCR_LANG,
+        config="--oem 1 --psm 3"
+    )
+def _ocr_pages(job):
+    # one pool task per run of pages. Without tesserocr the run goes to a
+    # single tesseract call over a list file, so the engine and traineddata
+    # load once per run instead of once per page.
+    pdf_path, indices, dpi = job
+    if _tess_api is not None or len(indices) == 1:
+        return [_ocr_one_page((pdf_path, i, dpi)) for i in indices]
+    pytesseract = lazy_pytesseract()
+    d = tmp_dir()
     try:
-        imgs = convert_from_path(
-            pdf_path,
-            dpi=dpi,
-            poppler_path=POPPLER_PATH,
-            output_folder=tmpd,
-            fmt="png",
-            paths_only=True,
-            thread_count=1,
-        )[:max_pages]
-        texts = []
-        for i, p in enumerate(imgs, 1):
-            with Image.open(p).convert("L") as im:
-                txt = pytesseract.image_to_string(
-                    im,
-                    lang="hin+mar+guj+eng",
-                    config="--psm 3"
-                )
-                texts.append(txt)
-        return merge_lines_to_paragraphs("\n".join(texts))
+        names = []
+        for i in indices:
+            name = os.path.join(d, f"page_{i:04d}.png")
+            _render_gray(pdf_path, i, dpi).save(name)
+            names.append(name)
+        listing = os.path.join(d, "pages.txt")
+        with open(listing, "w") as fh:
+            fh.write("\n".join(names) + "\n")
+        out = pytesseract.image_to_string(listing, lang=OCR_LANG, config="--oem 1 --psm 3")
     finally:
-        cleanup(tmpd)
+        cleanup(d)
+    # tesseract ends every page with a form feed
+    pages = out.split("\f")
+    if len(pages) < len(indices):
+        return [_ocr_one_page((pdf_path, i, dpi)) for i in indices]
+    return pages[:len(indices)]
+def _ocr_word_confidences(job):
+    if _tess_api is not None:
+        _set_tess_page(*job)
+        return list(_tess_api.AllWordConfidences())
+    pytesseract = lazy_pytesseract()
+    data = pytesseract.image_to_data(
+        _render_gray(*job),
+        lang=OCR_LANG,
+        config="--oem 1 --psm 3",
+        output_type=pytesseract.Output.DICT
+    )
+    return [float(c) for c in data["conf"] if float(c) >= 0]
+def choose_ocr_dpi(confidences):
+    # If tesseract already reads the page confidently at OCR_SAMPLE_DPI,
+    # 100 DPI is plenty; weak or empty reads get more pixels.
+    if not confidences:
+        return 200
+    sure = sum(c > 80 for c in confidences) / len(confidences)
+    if sure >= 0.75:
+        return 100
+    if sure >= 0.4:
+        return OCR_DPI
+    return 200
+def ocr_batches(pdf_path, indices, dpi):
+    # one contiguous run per pool process, at most OCR_BATCH_PAGES long
+    size = min(-(-len(indices) // max(OCR_WORKERS, 1)), OCR_BATCH_PAGES)
+    return [(pdf_path, indices[k:k + size], dpi) for k in range(0, len(indices), size)]
+def ocr_pdf_to_text(pdf_path, max_pages=MAX_OCR_PAGES, dpi=None):
+    key = cache_key("ocr", pdf_path, max_pages=max_pages, dpi=dpi)
+    hit = cache_get(key)
+    if hit:
+        with hit:
+            return hit.read().decode("utf-8")
+    # mixed documents: keep the text layer of every page and rasterize
+    # only the ones without one; max_pages caps the OCR work, not the text
+    texts = extract_native_text(pdf_path)
+    scanned = [i for i, t in enumerate(texts) if len(t.strip()) <= OCR_PAGE_TEXT_MIN_CHARS][:max_pages]
+    if scanned:
+        try:
+            pool = get_ocr_pool()
+            if dpi is None:
+                # one cheap low-res pass picks the DPI for the document
+                dpi = OCR_DPI
+                if len(scanned) > 1:
+                    confs = pool.submit(_ocr_word_confidences, (pdf_path, scanned[0], OCR_SAMPLE_DPI)).result()
+                    dpi = choose_ocr_dpi(confs)
+            jobs = ocr_batches(pdf_path, scanned, dpi)
+            # batches are independent; map keeps them in page order
+            ocr_texts = [t for batch in pool.map(_ocr_pages, jobs) for t in batch]
+        except BrokenProcessPool:
+            # a pool process died (usually OOM); rebuild next time, finish inline
+            reset_ocr_pool()
+            jobs = ocr_batches(pdf_path, scanned, dpi or OCR_DPI)
+            ocr_texts = [t for j in jobs for t in _ocr_pages(j)]
+        for i, t in zip(scanned, ocr_texts):
+            texts[i] = t
+    text = merge_lines_to_paragraphs(page_lines(texts))
+    cache_put_text(key, text)
+    return text
+def stream_page_text(pdf_path, max_ocr_pages=MAX_OCR_PAGES):
+    # NDJSON, one {"page", "text"} object per line: only the current page
+    # is held in memory and the client can start reading straight away
+    fitz = lazy_fitz()
+    with fitz.open(pdf_path) as doc:
+        for i, page in enumerate(doc):
+            t = page.get_text("text")
+            if len(t.strip()) <= OCR_PAGE_TEXT_MIN_CHARS and max_ocr_pages > 0:
+                max_ocr_pages -= 1
+                job = (pdf_path, i, OCR_DPI)
+                try:
+                    t = get_ocr_pool().submit(_ocr_one_page, job).result()
+                except BrokenProcessPool:
+                    reset_ocr_pool()
+                    t = _ocr_one_page(job)
+            # app.json: orjson when installed, same as the buffered response
+            yield app.json.dumps({"page": i + 1, "text": merge_lines_to_paragraphs(t)}) + "\n"
 # ======================================================
 # ROUTES 
 # ======================================================
@@ -188,21 +623,16 @@ def rotate_pdf():
     angle = int(request.form.get("angle", 90))
     if angle not in (90, 180, 270):
         abort(400, "Angle must be 90, 180, or 270")
-    PdfReader, PdfWriter, _ = lazy_pypdf()
-    pdf = save_upload(request.files["file"], ".pdf", get_limit_for_tool(tool))
+    pikepdf = lazy_pikepdf()
+    f = request.files["file"]
+    pdf = save_upload(f, ".pdf", get_limit_for_tool(tool))
     out = tmp_file(".pdf")
-    @after_this_request
-    def _c(r):
-        cleanup(pdf)
-        cleanup(out)
-        return r
-    reader = PdfReader(pdf)
-    writer = PdfWriter()
-    for p in reader.pages:
-        p.rotate(angle)
-        writer.add_page(p)
-    with open(out, "wb") as f:
-        writer.write(f)
+    cleanup_after_request(pdf, out)
+    # only each page's /Rotate changes; qpdf writes every other object as-is
+    with pikepdf.open(pdf) as src:
+        for page in src.pages:
+            page.rotate(angle, relative=True)
+        src.save(out)
     original_name = os.path.splitext(f.filename)[0]
     download_name = f"{original_name}_rotated.pdf"
     response = send_file(out, as_attachment=True)
@@ -214,22 +644,41 @@ def rotate_pdf():
 @app.get("/")
 def home():
     return "PDF Tools Backend Running"
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Expose-Headers": "X-Filename",
+}
 @app.after_request
 def cors(r):
-    r.headers["Access-Control-Allow-Origin"] = "*"
-    r.headers["Access-Control-Allow-Headers"] = "*"
-    r.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
-    r.headers["Access-Control-Expose-Headers"] = "X-Filename"
+    # update() replaces, so headers flask_cors already set aren't doubled
+    r.headers.update(CORS_HEADERS)
     return r
-@app.before_request
-def preflight():
-    if request.method == "OPTIONS":
-        return app.make_response("")
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+# Flask already answers OPTIONS for every registered route without calling
+# the view; this only catches preflights to unknown paths, and keeps a
+# before_request hook off the POST hot path
+@app.route("/<path:_>", methods=["OPTIONS"])
+def preflight(_):
+    return ""
+@app.errorhandler(405)
+def method_not_allowed(e):
+    # the catch-all makes every path "exist" for OPTIONS, so GET/POST to an
+    # unknown path would come back 405; keep those a 404
+    endpoint, _ = app.create_url_adapter(request).match(method="OPTIONS")
+    return NotFound() if endpoint == "preflight" else e
 # ======================================================
 # PDF → WORD (pdf2docx + OCR fallback)
 # ======================================================
+def pdf_may_be_encrypted(pdf_path, probe=64 * 1024):
+    # /Encrypt sits in the trailer (or xref-stream dict) at the end, or in
+    # the first-page trailer of a linearized file, so the two ends of the
+    # file are enough to rule encryption out without parsing anything
+    with open(pdf_path, "rb") as fh:
+        head = fh.read(probe)
+        fh.seek(max(0, os.fstat(fh.fileno()).st_size - probe))
+        tail = fh.read(probe)
+    return b"/Encrypt" in head or b"/Encrypt" in tail
 @app.post("/pdf-to-word")
 def pdf_to_word():
     tool = "pdf-to-word"
@@ -239,46 +688,42 @@ def pdf_to_word():
     ok, err = check_request_size_from_files([f], tool)
     if not ok:
         abort(413, err)
-    PdfReader, PdfWriter, _ = lazy_pypdf()
     Converter = lazy_pdf2docx_converter()
     Document = lazy_docx_Document()
     pdf_path = save_upload(f, ".pdf", get_limit_for_tool(tool))
     unlocked_pdf = tmp_file(".pdf")
     out_docx = tmp_file(".docx")
-    @after_this_request
-    def _cleanup(resp):
-        cleanup(pdf_path)
-        cleanup(unlocked_pdf)
-        cleanup(out_docx)
-        return resp
-    reader = PdfReader(pdf_path, strict=False)
+    cleanup_after_request(pdf_path, unlocked_pdf, out_docx)
+    key = cache_key(tool, pdf_path)
+    hit = cache_get(key)
+    if hit:
+        return send_file(hit, as_attachment=True, download_name="output.docx")
     pdf_to_use = pdf_path
-    if getattr(reader, "is_encrypted", False):
-        if reader.decrypt("") != 1:
-            try:
-                pikepdf = lazy_pikepdf()
-                with pikepdf.open(pdf_path, password="") as p:
+    if pdf_may_be_encrypted(pdf_path):
+        pikepdf = lazy_pikepdf()
+        try:
+            with pikepdf.open(pdf_path, password="") as p:
+                if p.is_encrypted:
                     p.save(unlocked_pdf)
-                pdf_to_use = unlocked_pdf
-            except Exception:
-                return jsonify({"error": "PDF encrypted. Unlock first."}), 400
-        else:
-            writer = PdfWriter()
-            for p in reader.pages:
-                writer.add_page(p)
-            with open(unlocked_pdf, "wb") as o:
-                writer.write(o)
-            pdf_to_use = unlocked_pdf
+                    pdf_to_use = unlocked_pdf
+        except pikepdf.PasswordError:
+            return jsonify({"error": "PDF encrypted. Unlock first."}), 400
     try:
         cv = Converter(pdf_to_use)
         cv.convert(out_docx, start=0, end=None)
         cv.close()
         doc = Document(out_docx)
         if doc.paragraphs:
+            cache_put(key, out_docx)
             return send_file(out_docx, as_attachment=True, download_name="output.docx")
     except Exception:
         pass  # fallback to OCR
-    text = ocr_pdf_to_text(pdf_to_use)
+    # born-digital PDFs already carry their text; only scans need OCR
+    pages = extract_native_text(pdf_to_use)
+    if has_text_layer(pages):
+        text = merge_lines_to_paragraphs(page_lines(pages))
+    else:
+        text = ocr_pdf_to_text(pdf_to_use)
     doc = Document()
     for block in text.split("\n\n"):
         if block.startswith("•"):
@@ -287,13 +732,54 @@ def pdf_to_word():
         else:
             doc.add_paragraph(block)
     doc.save(out_docx)
+    cache_put(key, out_docx)
     return send_file(out_docx, as_attachment=True, download_name="output.docx")
 # ======================================================
 # WORD → PDF
 # ======================================================
+def libreoffice_profile():
+    # one profile per worker thread: concurrent soffice runs sharing a
+    # profile hand off to each other and exit 0 without converting
+    return f"file:///tmp/lo_profile_{os.getpid()}_{threading.get_ident()}"
+_unoserver_turn = itertools.count()
+def unoserver_port():
+    # round-robin so concurrent conversions land on different LibreOffice
+    # instances (each one converts a single document at a time); skip any
+    # that refuse connections — the client would retry a dead one for ~50s
+    start = next(_unoserver_turn)
+    for i in range(len(UNOSERVER_PORTS)):
+        port = UNOSERVER_PORTS[(start + i) % len(UNOSERVER_PORTS)]
+        try:
+            with socket.create_connection(("127.0.0.1", int(port)), timeout=1):
+                return port
+        except OSError:
+            continue
+    raise ConnectionError("no unoserver is accepting connections")
+def unoserver_convert(input_path, out_dir, convert_filter):
+    # same "ext:filter:options" spec and output name as soffice --convert-to
+    ext, _, rest = convert_filter.partition(":")
+    filtername, _, options = rest.partition(":")
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    UnoClient = lazy_unoclient()
+    UnoClient(port=unoserver_port(), host_location="local").convert(
+        inpath=input_path,
+        outpath=os.path.join(out_dir, f"{base}.{ext}"),
+        convert_to=ext,
+        filtername=filtername or None,
+        filter_options=[options] if options else [],
+        update_index=False,
+    )
 def safe_libreoffice_convert(input_path, out_dir, convert_filter):
+    # a running LibreOffice skips the 1-3s soffice bootstrap per conversion
+    if UNOSERVER_PORTS:
+        try:
+            unoserver_convert(input_path, out_dir, convert_filter)
+            return
+        except Exception as e:
+            logging.warning("unoserver conversion failed, using soffice: %s", e)
     cmd = [
-        "libreoffice",
+        LIBREOFFICE_PATH or "libreoffice",
+        f"-env:UserInstallation={libreoffice_profile()}",
         "--headless",
         "--nologo",
         "--nolockcheck",
@@ -318,26 +804,23 @@ def word_to_pdf():
         abort(400)
     doc_path = save_upload(f, ext, get_limit_for_tool(tool))
     out_dir = tmp_dir()
-    @after_this_request
-    def _c(r):
-        cleanup(doc_path)
-        cleanup(out_dir)
-        return r
-    # STEP 1: DOC/DOCX → ODT
-    safe_libreoffice_convert(doc_path, out_dir, "odt")
-    base = os.path.splitext(os.path.basename(doc_path))[0]
-    odt_path = os.path.join(out_dir, base + ".odt")
-    if not os.path.exists(odt_path):
-        abort(500, "ODT conversion failed")
-    # STEP 2: ODT → PDF (best quality)
-    safe_libreoffice_convert(
-        odt_path,
-        out_dir,
-        "pdf:writer_pdf_Export:EmbedFonts=true"
-    )
-    out_pdf = os.path.join(out_dir, base + ".pdf")
-    if not os.path.exists(out_pdf):
-        abort(500, "PDF conversion failed")
+    cleanup_after_request(doc_path, out_dir)
+    key = cache_key(tool, doc_path, ext=ext)
+    with cache_lock(key):
+        hit = cache_get(key)
+        if hit:
+            return send_file(hit, as_attachment=True, download_name="output.pdf")
+        # DOC/DOCX → PDF in one pass; an intermediate ODT only doubled the work
+        safe_libreoffice_convert(
+            doc_path,
+            out_dir,
+            "pdf:writer_pdf_Export:EmbedFonts=true"
+        )
+        base = os.path.splitext(os.path.basename(doc_path))[0]
+        out_pdf = os.path.join(out_dir, base + ".pdf")
+        if not os.path.exists(out_pdf):
+            abort(500, "PDF conversion failed")
+        cache_put(key, out_pdf)
     return send_file(out_pdf, as_attachment=True, download_name="output.pdf")
 # ======================================================
 # PPT → PDF
@@ -356,21 +839,23 @@ def ppt_to_pdf():
         abort(400, "Invalid PPT file")
     ppt = save_upload(f, ext, get_limit_for_tool(tool))
     out_dir = tmp_dir()
-    @after_this_request
-    def _cleanup(r):
-        cleanup(ppt)
-        cleanup(out_dir)
-        return r
-    try:
-        safe_libreoffice_convert(ppt, out_dir, "pdf")
-    except Exception as e:
-        abort(500, "LibreOffice conversion failed")
-    base = os.path.splitext(os.path.basename(ppt))[0]
-    out_pdf = os.path.join(out_dir, base + ".pdf")
-    if not os.path.exists(out_pdf):
-        abort(500, "PDF not generated (LibreOffice missing)")
+    cleanup_after_request(ppt, out_dir)
     final_name = os.path.splitext(f.filename)[0] + ".pdf"
-    response = send_file(out_pdf, as_attachment=True)
+    key = cache_key(tool, ppt, ext=ext)
+    with cache_lock(key):
+        out_pdf = cache_get(key)
+        if not out_pdf:
+            try:
+                safe_libreoffice_convert(ppt, out_dir, "pdf")
+            except Exception as e:
+                abort(500, "LibreOffice conversion failed")
+            base = os.path.splitext(os.path.basename(ppt))[0]
+            out_pdf = os.path.join(out_dir, base + ".pdf")
+            if not os.path.exists(out_pdf):
+                abort(500, "PDF not generated (LibreOffice missing)")
+            cache_put(key, out_pdf)
+    # a cache hit is an open file, so the type comes from download_name
+    response = send_file(out_pdf, as_attachment=True, download_name=final_name)
     response.headers["X-Filename"] = final_name
     return response
 # ======================================================
@@ -385,33 +870,57 @@ def jpg_to_pdf():
     ok, err = check_request_size_from_files(files, tool)
     if not ok:
         abort(413, err)
-    Image = lazy_pil_Image()
-    images = []
-    saved = []
     out_pdf = tmp_file(".pdf")
-    @after_this_request
-    def _c(r):
-        for p in saved:
-            cleanup(p)
-        cleanup(out_pdf)
-        return r
-    for f in files:
-        p = save_upload(f, None, get_limit_for_tool(tool))
-        saved.append(p)
-        with Image.open(p).convert("RGB") as im:
-            images.append(im.copy())
-    images[0].save(
-    out_pdf,
-    save_all=True,
-    append_images=images[1:],
-    dpi=(300, 300),
-    quality=95,
-    subsampling=0
-)
+    paths = [save_upload(f, None, get_limit_for_tool(tool)) for f in files]
+    cleanup_after_request(out_pdf, *paths)
+    try:
+        # JPEGs go into the PDF as-is (no decode, no re-encode)
+        img2pdf = lazy_img2pdf()
+        with open(out_pdf, "wb") as fh:
+            img2pdf.convert(paths, layout_fun=img2pdf.get_fixed_dpi_layout_fun((300, 300)), outputstream=fh)
+    except Exception:
+        # inputs img2pdf cannot embed (odd modes, broken headers): re-encode with Pillow
+        Image = lazy_pil_Image()
+        # append one page per image so only a single decoded image is alive;
+        # collecting them for append_images kept every page's pixels in RAM
+        for i, p in enumerate(paths):
+            with Image.open(p) as src, src.convert("RGB") as im:
+                im.save(
+                    out_pdf,
+                    "PDF",
+                    append=i > 0,
+                    dpi=(300, 300),
+                    quality=95,
+                    subsampling=0
+                )
     return send_file(out_pdf, as_attachment=True, download_name="output.pdf")
 # ======================================================
 # PDF → JPG (PAGE AWARE)
 # ======================================================
+# "1-3, 5" -> [(1, 3), (5, 5)], one regex scan; spans are never expanded
+# here, so "1-999999999" costs nothing until it is checked against the PDF
+PAGE_SPAN_RE = re.compile(r"\s*(\d+)\s*(?:-\s*(\d+)\s*)?")
+def parse_page_spans(spec):
+    spans = []
+    for part in spec.split(","):
+        m = PAGE_SPAN_RE.fullmatch(part)
+        if not m:
+            abort(400, "Invalid page range")
+        a = int(m.group(1))
+        spans.append((a, int(m.group(2) or a)))
+    return spans
+PDF_TO_JPG_QUALITY = 95  # MuPDF's default, kept when encoding moved to Pillow
+def pixmap_to_jpeg(pix):
+    # Pillow's wheels bundle libjpeg-turbo (SIMD DCT and colour conversion);
+    # MuPDF's own JPEG writer is ~10x slower on a 200 dpi page. For RGB,
+    # frombuffer copies the samples once (it only maps L/RGBX/RGBA-style
+    # buffers in place); an alpha pixmap would avoid that but renders the
+    # page background transparent, which JPEG can't keep.
+    Image = lazy_pil_Image()
+    im = Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1)
+    buf = io.BytesIO()
+    im.save(buf, "JPEG", quality=PDF_TO_JPG_QUALITY)
+    return buf.getvalue()
 @app.post("/pdf-to-jpg")
 def pdf_to_jpg():
     tool = "pdf-to-jpg"
@@ -422,42 +931,20 @@ def pdf_to_jpg():
     if not ok:
         abort(413, err)
     pages = request.form.get("pages")
-    convert_from_path = lazy_pdf2image_convert()
-    pdf = save_upload(f, ".pdf", get_limit_for_tool(tool))
-    out_dir = tmp_dir()
-    zip_path = tmp_file(".zip")
-    @after_this_request
-    def _c(r):
-        cleanup(pdf)
-        cleanup(out_dir)
-        cleanup(zip_path)
-        return r
     # ✅ Parse page ranges
-    page_numbers = None
-    if pages:
-        page_numbers = set()
-        for part in pages.split(","):
-            if "-" in part:
-                a, b = map(int, part.split("-"))
-                page_numbers.update(range(a, b + 1))
-            else:
-                page_numbers.add(int(part))
-    imgs = convert_from_path(
-        pdf,
-        dpi=PDF_TO_JPG_DPI,
-        poppler_path=POPPLER_PATH,
-        output_folder=out_dir,
-        fmt="jpeg",
-        paths_only=True,
-        thread_count=IMAGE_THREAD_COUNT,
-    )
-    with zipfile.ZipFile(zip_path, "w") as z:
-        for i, p in enumerate(imgs, 1):
-            if page_numbers and i not in page_numbers:
-                continue
-            z.write(p, f"page_{i}.jpg")
+    spans = parse_page_spans(pages) if pages else None
+    fitz = lazy_fitz()
+    pdf = save_upload(f, ".pdf", get_limit_for_tool(tool))
+    def render():
+        # pages are rendered as the zip is streamed, not all up front
+        with fitz.open(pdf) as doc:
+            for i, page in enumerate(doc, 1):
+                if spans and not any(a <= i <= b for a, b in spans):
+                    continue
+                # encoded in memory and stored as-is: no temp JPEG to re-read
+                yield f"page_{i}.jpg", pixmap_to_jpeg(page.get_pixmap(dpi=PDF_TO_JPG_DPI))
     orig = os.path.splitext(f.filename)[0]
-    resp = send_file(zip_path, as_attachment=True)
+    resp = send_zip_stream(render(), "images.zip", pdf)
     return with_filename(resp, f"{orig}_images.zip")
 # ======================================================
 # MERGE PDF
@@ -469,18 +956,24 @@ def merge_pdf():
     ok, err = check_request_size_from_files(files, tool)
     if not ok:
         abort(413, err)
-    _, _, PdfMerger = lazy_pypdf()
-    merger = PdfMerger()
+    pikepdf = lazy_pikepdf()
     out = tmp_file(".pdf")
-    @after_this_request
-    def _c(r):
-        cleanup(out)
-        return r
-    for f in files:
-        p = save_upload(f, ".pdf", get_limit_for_tool(tool))
-        merger.append(p)
-    merger.write(out)
-    merger.close()
+    paths = [save_upload(f, ".pdf", get_limit_for_tool(tool)) for f in files]
+    cleanup_after_request(out, *paths)
+    # qpdf copies page objects without re-encoding content streams; it reads
+    # stream data from the sources at save time, so they stay open until then.
+    # Object streams pack the copied dictionaries and shrink the xref.
+    sources = []
+    try:
+        with pikepdf.Pdf.new() as merged:
+            for p in paths:
+                src = pikepdf.open(p)
+                sources.append(src)
+                merged.pages.extend(src.pages)
+            merged.save(out, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+    finally:
+        for src in sources:
+            src.close()
     resp = send_file(out, as_attachment=True)
     return with_filename(resp, "merged.pdf")
 # ======================================================
@@ -496,57 +989,120 @@ def split_pdf():
     ok, err = check_request_size_from_files([f], tool)
     if not ok:
         abort(413, err)
-    PdfReader, PdfWriter, _ = lazy_pypdf()
+    spans = parse_page_spans(ranges)
+    pikepdf = lazy_pikepdf()
     pdf = save_upload(f, ".pdf", get_limit_for_tool(tool))
-    out_dir = tmp_dir()
-    zip_path = tmp_file(".zip")
-    @after_this_request
-    def _c(r):
+    # the upload is only cleaned up by the streamed response; if we never
+    # get that far it has to go here
+    try:
+        src = pikepdf.open(pdf)
+    except Exception:
+        cleanup(pdf)
+        abort(400, "Invalid PDF")
+    # validate before streaming: once the zip has started it is too late
+    # to turn a bad page number into an error response
+    if not all(1 <= a and b <= len(src.pages) for a, b in spans if a <= b):
+        src.close()
         cleanup(pdf)
-        cleanup(out_dir)
-        cleanup(zip_path)
-        return r
-    reader = PdfReader(pdf)
-    with zipfile.ZipFile(zip_path, "w") as z:
-        for r in ranges.split(","):
-            a, b = map(int, r.split("-")) if "-" in r else (int(r), int(r))
-            for i in range(a, b + 1):
-                w = PdfWriter()
-                w.add_page(reader.pages[i - 1])
-                p = os.path.join(out_dir, f"page_{i}.pdf")
-                with open(p, "wb") as o:
-                    w.write(o)
-                z.write(p, f"page_{i}.pdf")
-    return send_file(zip_path, as_attachment=True, download_name="split.zip")
+        abort(400, "Page out of range")
+    def pages():
+        # each one-page PDF goes from memory straight into the zip
+        try:
+            for i in (i for a, b in spans for i in range(a, b + 1)):
+                with pikepdf.Pdf.new() as one:
+                    one.pages.append(src.pages[i - 1])
+                    buf = io.BytesIO()
+                    one.save(buf)
+                yield f"page_{i}.pdf", buf.getvalue()
+        finally:
+            src.close()
+    return send_zip_stream(pages(), "split.zip", pdf)
 # ======================================================
 # COMPRESS PDF
 # ======================================================
-@app.post("/compress-pdf")
-def compress_pdf():
-    tool = "compress-pdf"
-    f = request.files.get("file")
-    if not f:
-        abort(400)
-    if not shutil.which("gs"):
-        abort(500, "Ghostscript not installed")
-    ok, err = check_request_size_from_files([f], tool)
-    if not ok:
-        abort(413, err)
-    level = request.form.get("level", "screen")
-    GS_LEVELS = {
-        "low": "/screen",     # maximum compression
-        "medium": "/ebook",   # balanced
-        "high": "/printer",   # high quality
-    }
-    inp = save_upload(f, ".pdf", get_limit_for_tool(tool))
+GS_LEVELS = {
+    "low": "/screen",     # maximum compression
+    "medium": "/ebook",   # balanced
+    "high": "/printer",   # high quality
+}
+# mode=images: JPEG quality per level when recompressing without Ghostscript
+JPEG_QUALITY = {"low": 50, "medium": 70, "high": 85}
+COMPRESS_IMAGE_DPI = 150
+# modes handled in-process by pikepdf, so they work without Ghostscript
+PIKEPDF_MODES = ("fast", "images")
+def recompress_images(pdf, quality):
+    # re-encode 8-bit DeviceRGB/DeviceGray images as JPEG, downsampled to
+    # roughly COMPRESS_IMAGE_DPI at page width; anything else (ICC profiles,
+    # CMYK, indexed, 16-bit, masked) is left alone rather than risk changing
+    # colours or transparency
+    pikepdf = lazy_pikepdf()
+    Image = lazy_pil_Image()
+    plain = (pikepdf.Name.DeviceRGB, pikepdf.Name.DeviceGray)
+    done = set()
+    for page in pdf.pages:
+        box = page.mediabox
+        max_w = int(abs(float(box[2]) - float(box[0])) / 72 * COMPRESS_IMAGE_DPI)
+        for raw in page.images.values():
+            if raw.objgen in done or raw.get("/ImageMask", False):
+                continue
+            done.add(raw.objgen)
+            # a colour-key /Mask on lossy data speckles; ICCBased et al. would
+            # lose their profile
+            if "/Mask" in raw or raw.get("/ColorSpace") not in plain:
+                continue
+            try:
+                im = pikepdf.PdfImage(raw).as_pil_image()
+            except Exception:
+                continue
+            if im.mode not in ("RGB", "L"):
+                continue
+            if im.width > max_w > 0:
+                im = im.resize((max_w, max(1, im.height * max_w // im.width)), Image.LANCZOS)
+            buf = io.BytesIO()
+            im.save(buf, "JPEG", quality=quality, optimize=True)
+            if buf.tell() >= len(raw.read_raw_bytes()):
+                continue
+            raw.write(buf.getvalue(), filter=pikepdf.Name.DCTDecode)
+            raw.Width, raw.Height = im.width, im.height
+            raw.BitsPerComponent = 8
+            for k in ("/Decode", "/DecodeParms"):
+                if k in raw:
+                    del raw[k]
+    for k in ("/Metadata", "/PieceInfo"):
+        if k in pdf.Root:
+            del pdf.Root[k]
+def send_compressed_pdf(inp, filename, level, mode=None):
     out = tmp_file(".pdf")
-    @after_this_request
-    def _c(r):
-        cleanup(inp)
-        cleanup(out)
-        return r
+    cleanup_after_request(inp, out)
+    orig = os.path.splitext(filename)[0]
+    final_name = f"{orig}_compressed.pdf"
+    if mode == "fast":
+        key = cache_key("compress-pdf", inp, mode="fast")
+    elif mode == "images":
+        key = cache_key("compress-pdf", inp, mode="images", quality=JPEG_QUALITY.get(level, 50))
+    else:
+        key = cache_key("compress-pdf", inp, level=GS_LEVELS.get(level, "/screen"))
+    hit = cache_get(key)
+    if hit:
+        resp = send_file(hit, as_attachment=True, download_name=final_name)
+        return with_filename(resp, final_name)
+    if mode in PIKEPDF_MODES:
+        # fast is lossless: recompress streams and pack objects into object
+        # streams; nothing is re-rendered, so it is I/O-bound where
+        # Ghostscript isn't. images also re-encodes embedded images as JPEG.
+        pikepdf = lazy_pikepdf()
+        with pikepdf.open(inp) as p:
+            if mode == "images":
+                recompress_images(p, JPEG_QUALITY.get(level, 50))
+            p.remove_unreferenced_resources()
+            p.save(out, compress_streams=True, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        if os.path.getsize(out) >= os.path.getsize(inp):
+            shutil.copyfile(inp, out)  # already tight: don't send back something bigger
+        cache_put(key, out)
+        resp = send_file(out, as_attachment=True)
+        return with_filename(resp, final_name)
     cmd = [
-        "gs",
+        GS_PATH,
         "-sDEVICE=pdfwrite",
         "-dCompatibilityLevel=1.4",
         f"-dPDFSETTINGS={GS_LEVELS.get(level, '/screen')}",
@@ -561,10 +1117,40 @@ def compress_pdf():
         inp
     ]
     run_subprocess(cmd)
-    orig = os.path.splitext(f.filename)[0]
-    final_name = f"{orig}_compressed.pdf"
+    cache_put(key, out)
     resp = send_file(out, as_attachment=True)
     return with_filename(resp, final_name)
+@app.post("/compress-pdf")
+def compress_pdf():
+    tool = "compress-pdf"
+    f = request.files.get("file")
+    if not f:
+        abort(400)
+    mode = request.form.get("mode")
+    if mode not in PIKEPDF_MODES and not GS_PATH:
+        abort(500, "Ghostscript not installed")
+    ok, err = check_request_size_from_files([f], tool)
+    if not ok:
+        abort(413, err)
+    level = request.form.get("level", "screen")
+    inp = save_upload(f, ".pdf", get_limit_for_tool(tool))
+    return send_compressed_pdf(inp, f.filename, level, mode)
+@app.post("/compress-pdf-raw")
+def compress_pdf_raw():
+    # body is the raw PDF (Content-Type: application/pdf), name in X-Filename,
+    # level/mode in the query string; skips Werkzeug's multipart parser entirely
+    tool = "compress-pdf"
+    if not request.content_length:
+        abort(400)
+    mode = request.args.get("mode")
+    if mode not in PIKEPDF_MODES and not GS_PATH:
+        abort(500, "Ghostscript not installed")
+    ok, err = check_request_size_from_files([], tool)
+    if not ok:
+        abort(413, err)
+    level = request.args.get("level", "screen")
+    inp = save_request_body(".pdf", get_limit_for_tool(tool))
+    return send_compressed_pdf(inp, request.headers.get("X-Filename", "document.pdf"), level, mode)
 # ======================================================
 # PROTECT / UNLOCK PDF
 # ======================================================
@@ -575,21 +1161,16 @@ def protect_pdf():
     pwd = request.form.get("password")
     if not f or not pwd:
         abort(400)
-    PdfReader, PdfWriter, _ = lazy_pypdf()
+    pikepdf = lazy_pikepdf()
     pdf = save_upload(f, ".pdf", get_limit_for_tool(tool))
     out = tmp_file(".pdf")
-    @after_this_request
-    def _c(r):
-        cleanup(pdf)
-        cleanup(out)
-        return r
-    r = PdfReader(pdf)
-    w = PdfWriter()
-    for p in r.pages:
-        w.add_page(p)
-    w.encrypt(pwd)
-    with open(out, "wb") as o:
-        w.write(o)
+    cleanup_after_request(pdf, out)
+    # encrypted on save, pages untouched (AES-256, pikepdf's default R=6)
+    try:
+        with pikepdf.open(pdf) as p:
+            p.save(out, encryption=pikepdf.Encryption(user=pwd, owner=pwd))
+    except pikepdf.PasswordError:
+        return jsonify({"error": "PDF encrypted. Unlock first."}), 400
     return send_file(out, as_attachment=True, download_name="protected.pdf")
 @app.post("/unlock-pdf")
 def unlock_pdf():
@@ -599,19 +1180,44 @@ def unlock_pdf():
     if not f:
         abort(400)
     pdf = save_upload(f, ".pdf", get_limit_for_tool(tool))
-    out = tmp_file(".pdf")
-    @after_this_request
-    def _c(r):
-        cleanup(pdf)
-        cleanup(out)
-        return r
+    return send_unlocked_pdf(pdf, pwd)
+@app.post("/unlock-pdf-raw")
+def unlock_pdf_raw():
+    # body is the raw PDF, password in X-Password (kept out of the URL and
+    # access logs); the body goes straight to disk, no multipart spooling
+    tool = "unlock-pdf"
+    if not request.content_length:
+        abort(400)
+    ok, err = check_request_size_from_files([], tool)
+    if not ok:
+        abort(413, err)
+    pdf = save_request_body(".pdf", get_limit_for_tool(tool))
+    return send_unlocked_pdf(pdf, request.headers.get("X-Password", ""))
+def send_unlocked_pdf(pdf, pwd):
+    cleanup_after_request(pdf)
+    pikepdf = lazy_pikepdf()
+    if not pdf_may_be_encrypted(pdf):
+        # the byte scan can miss /Encrypt (an xref stream far from EOF, junk
+        # after %%EOF), so confirm by opening the file before echoing it back
+        try:
+            with pikepdf.open(pdf) as p:
+                encrypted = p.is_encrypted
+        except pikepdf.PasswordError:
+            encrypted = True
+        except Exception:
+            abort(400, "Invalid PDF")
+        if not encrypted:
+            # nothing to unlock: hand the upload back instead of rewriting it
+            return send_file(pdf, as_attachment=True, download_name="unlocked.pdf", mimetype="application/pdf")
+    # output is no bigger than the (size-capped) upload: keep it in memory
+    buf = io.BytesIO()
     try:
-        pikepdf = lazy_pikepdf()
         with pikepdf.open(pdf, password=pwd) as p:
-            p.save(out)
+            p.save(buf)
     except Exception:
         abort(400, "Wrong password")
-    return send_file(out, as_attachment=True, download_name="unlocked.pdf")
+    buf.seek(0)
+    return send_file(buf, as_attachment=True, download_name="unlocked.pdf", mimetype="application/pdf")
 # ======================================================
 # EXTRACT TEXT
 # ======================================================
@@ -625,21 +1231,42 @@ def extract_text():
     if not ok:
         abort(413, err)
     pdf = save_upload(f, ".pdf", get_limit_for_tool(tool))
-    pdfplumber = lazy_pdfplumber()
-    @after_this_request
-    def _c(r):
-        cleanup(pdf)
-        return r
-    text = ""
-    with pdfplumber.open(pdf) as p:
-        for pg in p.pages:
-            t = pg.extract_text()
-            if t:
-                text += t + "\n"
-    if not text.strip():
-        text = ocr_pdf_to_text(pdf)
-    original_name = os.path.splitext(f.filename)[0]
+    return send_extracted_text(pdf, f.filename)
+@app.post("/extract-text-raw")
+def extract_text_raw():
+    # body is the raw PDF, name in X-Filename (same contract as /compress-pdf-raw)
+    tool = "extract-text"
+    if not request.content_length:
+        abort(400)
+    ok, err = check_request_size_from_files([], tool)
+    if not ok:
+        abort(413, err)
+    pdf = save_request_body(".pdf", get_limit_for_tool(tool))
+    return send_extracted_text(pdf, request.headers.get("X-Filename", "document.pdf"))
+def send_extracted_text(pdf, filename):
+    original_name = os.path.splitext(filename)[0]
+    if request.args.get("stream") == "1":
+        resp = Response(stream_page_text(pdf), mimetype="application/x-ndjson")
+        # the body is produced after the view returns: clean up once it is sent
+        resp.call_on_close(lambda: cleanup(pdf))
+        return with_filename(resp, f"{original_name}.txt")
+    cleanup_after_request(pdf)
+    pages = []
+    if not looks_scanned(pdf):
+        if EXTRACT_WITH_PDFPLUMBER:
+            pdfplumber = lazy_pdfplumber()
+            with pdfplumber.open(pdf) as p:
+                pages = [pg.extract_text() or "" for pg in p.pages]
+        else:
+            pages = extract_native_text(pdf)
+    if not any(t.strip() for t in pages):
+        pages = [ocr_pdf_to_text(pdf)]
     return jsonify({
-        "text": merge_lines_to_paragraphs(text),
+        "text": merge_lines_to_paragraphs(page_lines(pages)),
         "filename": f"{original_name}.txt"
     })
+if __name__ == "__main__":
+    # Flask's dev server is single-process; production runs under gunicorn
+    if os.environ.get("DEV_SERVER") != "1":
+        raise SystemExit("use: gunicorn -c gunicorn.conf.py app:app (or DEV_SERVER=1 python app.py)")
+    app.run(host="0.0.0.0", port=5000, debug=False)
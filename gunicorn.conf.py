@@ -0,0 +1,57 @@
+import importlib.util
+import os
+import shutil
+import subprocess
+
+# Flask is WSGI, so concurrency comes from threads: a thread blocked on
+# Ghostscript/LibreOffice/tesseract leaves the rest of the worker free.
+bind = "0.0.0.0:" + os.environ.get("PORT", "5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = 180
+# send_file hands back wsgi.file_wrapper; gunicorn serves it with
+# sendfile(2), so output files never pass through Python. (X-Sendfile
+# would not work here: responses come from per-request temp files that
+# are unlinked as soon as the view returns.)
+sendfile = True
+
+
+def post_worker_init(worker):
+    from app import warm_imports
+    warm_imports()
+
+
+def on_starting(server):
+    # A pool of LibreOffice instances for the whole host, started with
+    # the master: each unoserver converts one document at a time, so workers
+    # spread conversions across them (app.py reads UNOSERVER_PORTS) and fall
+    # back to a one-shot soffice if none is up. UNOSERVER=0 disables them.
+    if os.environ.get("UNOSERVER", "1") != "1" or not shutil.which("unoserver"):
+        return
+    if importlib.util.find_spec("uno") is None:
+        return
+    # each instance is a resident LibreOffice (~150 MB+); one fits the
+    # 512 MB deploy, raise UNOSERVER_INSTANCES where there is memory for more
+    count = int(os.environ.get("UNOSERVER_INSTANCES", 1))
+    base = int(os.environ.get("UNOSERVER_BASE_PORT", 2003))
+    server.unoservers, ports = [], []
+    for i in range(count):
+        # XML-RPC port, then the UNO port right after it; separate profiles
+        # so the instances don't hand documents to each other
+        port, uno_port = base + 2 * i, base + 2 * i + 1
+        server.unoservers.append(subprocess.Popen([
+            "unoserver",
+            "--interface", "127.0.0.1",
+            "--port", str(port),
+            "--uno-port", str(uno_port),
+            "--user-installation", f"/tmp/lo_unoserver_{i}",
+            "--conversion-timeout", "120",
+        ]))
+        ports.append(str(port))
+    os.environ["UNOSERVER_PORTS"] = ",".join(ports)
+
+
+def on_exit(server):
+    for proc in getattr(server, "unoservers", []):
+        proc.terminate()